@@ -1,74 +1,528 @@
-from flask import Flask, request, jsonify, render_template_string, send_file
+from flask import Flask, Response, request, jsonify, send_file, g
+from werkzeug.exceptions import RequestEntityTooLarge, ServiceUnavailable
 import pandas as pd
+import numpy as np
 import os
 import io
 import uuid
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 import traceback
 import tempfile
-import base64
+import gzip
+import hashlib
 import math
+from string import Template
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# 优先使用Rust实现的calamine解析xlsx和xls，未安装时xlsx回退到openpyxl，xls交给pandas默认引擎（xlrd）
+try:
+    import python_calamine  # noqa: F401
+    XLSX_ENGINE = 'calamine'
+    XLS_ENGINE = 'calamine'
+except ImportError:
+    XLSX_ENGINE = 'openpyxl'
+    XLS_ENGINE = None
+
+# 导出使用xlsxwriter（不建cell对象树，更快更省内存），未安装时回退到openpyxl
+# xlsxwriter不逐个检查字符串是否像URL，原样写成文本（也不会生成超链接）
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITER_ENGINE = 'xlsxwriter'
+    EXCEL_WRITER_KWARGS = {'options': {'strings_to_urls': False}}
+except ImportError:
+    EXCEL_WRITER_ENGINE = 'openpyxl'
+    EXCEL_WRITER_KWARGS = {}
+
+# JSON响应优先用orjson序列化（Rust实现），未安装时沿用Flask默认的json
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+    
+    class OrjsonProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+    
+    app.json = OrjsonProvider(app)
+except ImportError:
+    pass
+
+# 解析结果缓存：(文件内容哈希, 解析引擎) -> [已解析并压缩存储的DataFrame, 占用字节数, 过期时间, 引用它的处理器]
+# 同一文件再次上传（同一会话重复上传、多个会话处理同一文件）时直接复用，不再解析Excel；
+# 各会话拿到的是浅拷贝，依赖pandas 3的写时复制互不影响（requirements.txt要求pandas>=3）
+# 条目闲置超过PARSE_CACHE_TTL秒即过期，总大小不超过PARSE_CACHE_MAX_BYTES，按最近使用淘汰；
+# 引用它的会话全部被释放（重置或闲置淘汰）时一并删除，不在会话之外继续占用内存
+PARSE_CACHE_SIZE = 4
+PARSE_CACHE_TTL = 30 * 60
+PARSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PARSE_CACHE = OrderedDict()
+PARSE_CACHE_LOCK = threading.Lock()
+
+def _expire_parse_cache(now):
+    """删除已过期的解析缓存条目（调用方持有PARSE_CACHE_LOCK）"""
+    for key in [key for key, entry in PARSE_CACHE.items() if entry[2] < now]:
+        del PARSE_CACHE[key]
+
+def _parse_cache_get(key, owner):
+    """取出缓存的解析结果（浅拷贝）并把owner记为引用者；没有缓存时返回None"""
+    now = time.monotonic()
+    with PARSE_CACHE_LOCK:
+        _expire_parse_cache(now)
+        entry = PARSE_CACHE.get(key)
+        if entry is None:
+            return None
+        PARSE_CACHE.move_to_end(key)
+        entry[2] = now + PARSE_CACHE_TTL
+        entry[3].add(owner)
+        return entry[0].copy(deep=False)
+
+def _parse_cache_put(key, frame, owner):
+    """缓存解析结果；单个结果超过字节上限时不缓存"""
+    nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+    if nbytes > PARSE_CACHE_MAX_BYTES:
+        return
+    now = time.monotonic()
+    with PARSE_CACHE_LOCK:
+        entry = PARSE_CACHE.get(key)
+        if entry is not None:
+            # 其他会话同时解析了同一文件
+            entry[2] = now + PARSE_CACHE_TTL
+            entry[3].add(owner)
+        else:
+            PARSE_CACHE[key] = [frame.copy(deep=False), nbytes, now + PARSE_CACHE_TTL, {owner}]
+        PARSE_CACHE.move_to_end(key)
+        _expire_parse_cache(now)
+        total = sum(entry[1] for entry in PARSE_CACHE.values())
+        while len(PARSE_CACHE) > PARSE_CACHE_SIZE or total > PARSE_CACHE_MAX_BYTES:
+            _, evicted = PARSE_CACHE.popitem(last=False)
+            total -= evicted[1]
+
+def _parse_cache_release(key, owner):
+    """owner不再引用该条目；已没有任何会话引用时删除"""
+    with PARSE_CACHE_LOCK:
+        entry = PARSE_CACHE.get(key)
+        if entry is not None:
+            entry[3].discard(owner)
+            if not entry[3]:
+                del PARSE_CACHE[key]
+
+# 同时进行的数据处理（解析、清洗、分析）上限，避免并发的pandas/BLAS计算互相争抢CPU和缓存；
+# 名额已满时最多等待PROCESS_SLOT_WAIT秒，仍无空位则返回503，请客户端PROCESS_RETRY_AFTER秒后重试
+PROCESS_SLOTS = threading.BoundedSemaphore(max(1, (os.cpu_count() or 2) // 2))
+PROCESS_SLOT_WAIT = 10
+PROCESS_RETRY_AFTER = 2
+
+# 一次 /process_batch 请求最多执行的操作数，避免单个请求长时间占用处理名额和会话锁
+MAX_BATCH_OPS = 16
+
+# 相关系数矩阵缓存：数值块内容指纹 -> 相关系数矩阵，各会话共享，按最近使用淘汰
+# 重新上传同一文件、或只改动了非数值列后再做相关性分析时直接复用
+CORR_CACHE_SIZE = 8
+CORR_CACHE = OrderedDict()
+CORR_CACHE_LOCK = threading.Lock()
+
+# 每个会话缓存的只读分析结果条数上限；数据修改后整体失效
+RESULT_CACHE_SIZE = 32
+
+# 卡方检验列联表的单元格上限（int64约8MB），超出时拒绝而不是占满内存
+MAX_CONTINGENCY_CELLS = 1_000_000
+
+# 行掩码按块计算时每块的元素数（float64约256KB，可留在CPU缓存内）
+MASK_BLOCK_SIZE = 32768
+
+def _row_mask(values, keep):
+    """按行分块计算掩码：keep(block)给出块内逐元素是否保留，整行都保留时为True"""
+    n_rows, n_cols = values.shape
+    mask = np.ones(n_rows, dtype=bool)
+    if n_cols == 0:
+        return mask
+    step = max(1, MASK_BLOCK_SIZE // n_cols)
+    for start in range(0, n_rows, step):
+        stop = start + step
+        keep(values[start:stop]).all(axis=1, out=mask[start:stop])
+    return mask
+
+def _widen_float32(frame):
+    """把float32列还原为float64；写入新计算出的浮点值前调用，避免精度损失"""
+    narrow = [col for col, dtype in frame.dtypes.items() if dtype == np.float32]
+    return frame.astype({col: np.float64 for col in narrow}) if narrow else frame
+
+def _nan_mean_std(values):
+    """逐列计算均值和样本标准差（ddof=1，忽略NaN）
+
+    与np.nanmean/np.nanstd结果相同，但有效值不足的列直接得到NaN，
+    不会触发"Mean of empty slice"等RuntimeWarning（np.errstate只作用于当前线程）
+    """
+    count = np.count_nonzero(~np.isnan(values), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(values, axis=0) / count
+        deviation = np.subtract(values, mean)
+        np.square(deviation, out=deviation)
+        std = np.sqrt(np.nansum(deviation, axis=0) / (count - 1))
+    std[count < 2] = np.nan
+    return mean, std
+
+def _pairwise_corr(values):
+    """逐列对的Pearson相关矩阵，每对列只使用两者都有值的行（与DataFrame.corr()一致）
+
+    各项和都由矩阵乘法得到，交给BLAS分块计算，代替逐列对遍历所有行的循环；
+    每列先减去自身的一个观测值，常数列的离差恰好为0，相关系数得到NaN
+    """
+    n_rows, n_cols = values.shape
+    observed = ~np.isnan(values)
+    shift = values[observed.argmax(axis=0), np.arange(n_cols)] if n_rows else np.zeros(n_cols)
+    shifted = np.where(observed, values - shift, 0.0)
+    if observed.all():
+        # 无缺失值：每列在所有列对中用到的行相同，和与平方和按列算一次即可
+        count = np.full((n_cols, n_cols), float(n_rows))
+        sums = np.broadcast_to(shifted.sum(axis=0)[:, None], (n_cols, n_cols))
+        squares = np.broadcast_to(np.einsum('ij,ij->j', shifted, shifted)[:, None], (n_cols, n_cols))
+    else:
+        # [i, j]项为列i在列i、j都有值的行上的计数/和/平方和
+        present = observed.astype(np.float64)
+        count = present.T @ present
+        sums = shifted.T @ present
+        squares = np.square(shifted).T @ present
+    products = shifted.T @ shifted
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = products - sums * sums.T / count
+        variance = squares - sums * sums / count
+        corr = covariance / np.sqrt(variance * variance.T)
+    corr[(count < 2) | (variance <= 0) | (variance.T <= 0)] = np.nan
+    diagonal = np.diagonal(corr)
+    np.fill_diagonal(corr, np.where(np.isnan(diagonal), np.nan, 1.0))
+    return corr
+
+def _fingerprint(columns, values):
+    """数值块的内容指纹：列名、形状和全部数值（按列优先顺序，通常无需复制）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((list(columns), values.shape)).encode('utf-8'))
+    digest.update(memoryview(np.asfortranarray(values).T))
+    return digest.hexdigest()
+
+# 生成代码模板：模块加载时构建一次；文件名、列名、参数一律经repr()代入，避免把用户输入拼进代码
+CODE_READ_EXCEL = Template("df = pd.read_excel($filename)")
+
+CODE_DROPNA = "df = df.dropna()"
+
+CODE_FILL_MEAN = """numeric_cols = df.select_dtypes(include=['number']).columns
+df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())"""
+
+CODE_FILL_MEDIAN = """numeric_cols = df.select_dtypes(include=['number']).columns
+df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())"""
+
+CODE_FILL_VALUE = Template("df = df.fillna($fill_value)")
+
+CODE_OUTLIERS_IQR = """# IQR方法处理异常值
+numeric_cols = df.select_dtypes(include=['number']).columns
+quartiles = df[numeric_cols].quantile([0.25, 0.75])
+Q1, Q3 = quartiles.iloc[0], quartiles.iloc[1]
+IQR = Q3 - Q1
+lower_bound = Q1 - 1.5 * IQR
+upper_bound = Q3 + 1.5 * IQR
+mask = ((df[numeric_cols] >= lower_bound) & (df[numeric_cols] <= upper_bound)).all(axis=1)
+df = df[mask]"""
+
+CODE_OUTLIERS_ZSCORE = Template("""# Z-score方法处理异常值
+numeric_cols = df.select_dtypes(include=['number']).columns
+mean = df[numeric_cols].mean()
+std = df[numeric_cols].std()
+cols = std[std > 0].index
+mask = ((df[cols] - mean[cols]).abs() < $threshold * std[cols]).all(axis=1)
+df = df[mask]""")
+
+CODE_DROP_DUPLICATES = "df = df.drop_duplicates()"
+
+CODE_STANDARDIZE_ZSCORE = """# Z-score标准化（标准差为0的列保持不变）
+numeric_cols = df.select_dtypes(include=['number']).columns
+mean = df[numeric_cols].mean()
+std = df[numeric_cols].std()
+cols = std[std > 0].index
+df[cols] = (df[cols] - mean[cols]) / std[cols]"""
+
+CODE_STANDARDIZE_MINMAX = """# Min-Max标准化（最大值等于最小值的列保持不变）
+numeric_cols = df.select_dtypes(include=['number']).columns
+min_val = df[numeric_cols].min()
+value_range = df[numeric_cols].max() - min_val
+cols = value_range[value_range > 0].index
+df[cols] = (df[cols] - min_val[cols]) / value_range[cols]"""
+
+CODE_CORRELATION = """# 相关性分析
+import pandas as pd
+import numpy as np
+numeric_cols = df.select_dtypes(include=['number']).columns
+correlation_matrix = df[numeric_cols].corr()
+print(correlation_matrix)
+
+# 强相关列对（|r| > 0.7）
+values = correlation_matrix.to_numpy()
+rows, cols = np.triu_indices_from(values, k=1)
+strong = np.abs(values[rows, cols]) > 0.7
+strong_pairs = list(zip(numeric_cols[rows[strong]], numeric_cols[cols[strong]], values[rows, cols][strong]))
+print(strong_pairs)"""
+
+CODE_T_TEST_TWO_SAMPLE = Template("""# 双样本t检验 (简化版本)
+import math
+sample1 = df[$column1].dropna()
+sample2 = df[$column2].dropna()
+mean1, mean2 = sample1.mean(), sample2.mean()
+var1, var2 = sample1.var(), sample2.var()
+n1, n2 = len(sample1), len(sample2)
+pooled_var = ((n1-1)*var1 + (n2-1)*var2) / (n1+n2-2)
+t_statistic = (mean1 - mean2) / math.sqrt(pooled_var * (1/n1 + 1/n2))
+print(f'T统计量: {t_statistic:.4f}')""")
+
+CODE_T_TEST_ONE_SAMPLE = Template("""# 单样本t检验 (简化版本)
+import math
+sample = df[$column1].dropna()
+mean = sample.mean()
+std = sample.std()
+n = len(sample)
+test_value = $value
+t_statistic = (mean - test_value) / (std / math.sqrt(n))
+print(f'T统计量: {t_statistic:.4f}')""")
+
+CODE_CHI_SQUARE = Template("""# 卡方检验 (简化版本)
+import numpy as np
+contingency_table = pd.crosstab(df[$column1], df[$column2])
+observed = contingency_table.to_numpy()
+row_totals = observed.sum(axis=1)
+col_totals = observed.sum(axis=0)
+
+# 期望频数由行、列合计的外积得到
+expected = np.outer(row_totals, col_totals) / observed.sum()
+chi_square = ((observed - expected) ** 2 / expected).sum()
+
+print(f'卡方统计量: {chi_square:.4f}')
+print(contingency_table)""")
+
+def render_code(template, **values):
+    """用repr()后的参数填充代码模板"""
+    return template.substitute({key: repr(value) for key, value in values.items()})
+
 class DataProcessor:
     def __init__(self):
         self.df = None
         self.code_history = []
+        # 代码版本号：code_history每变化一次递增1，客户端据此判断是否需要重新获取完整代码
+        self.code_version = 0
+        # 拼接好的完整代码及其对应的代码版本
+        self._complete_code = None
+        self._complete_code_version = -1
+        # 数值列索引缓存，仅在列集合或列类型可能变化时失效
+        self._numeric_cols = None
+        # 是否含缺失值/重复行：None表示未知，需要时再扫描一次
+        self._has_na = None
+        self._has_duplicates = None
+        # 数据概况（形状、列名、缺失值计数）缓存及其对应的数据版本
+        self._info = None
+        self._info_version = -1
+        # 导出的Excel字节缓存及其对应的数据版本，数据未变时重复下载不再重新生成
+        self._excel = None
+        self._excel_version = -1
+        # 只读分析（不修改self.df）的结果缓存：(操作, 参数) -> 结果，仅对_results_version版本的数据有效
+        self._results = OrderedDict()
+        self._results_version = -1
+        # 数据版本号：self.df每被修改一次递增1，供结果缓存判断是否过期
+        self.version = 0
+        # 当前数据对应的解析缓存键，会话释放时据此放开对缓存条目的引用
+        self._parse_key = None
+        # 同一会话内的操作串行执行，不同会话之间互不阻塞
+        self.lock = threading.Lock()
     
-    def load_data_from_base64(self, file_content, filename):
-        """从base64数据加载Excel"""
+    def load_data_from_stream(self, stream, filename):
+        """从文件流加载Excel"""
         try:
-            # 解码base64数据
-            file_data = base64.b64decode(file_content.split(',')[1])
-            
-            # 使用BytesIO创建文件对象
-            file_obj = io.BytesIO(file_data)
-            
-            # 根据文件扩展名选择读取方法
+            # 根据文件扩展名选择读取方法；fallback为calamine解析失败时改用的引擎
+            # （只有xlsx有：xls的其他引擎xlrd不在依赖中）
             if filename.endswith('.xlsx'):
-                self.df = pd.read_excel(file_obj, engine='openpyxl')
+                engine, fallback = XLSX_ENGINE, 'openpyxl'
             elif filename.endswith('.xls'):
-                self.df = pd.read_excel(file_obj)
+                engine, fallback = XLS_ENGINE, None
             else:
                 return False, "不支持的文件格式"
             
+            data = stream.read()
+            key = (hashlib.blake2b(data, digest_size=16).hexdigest(), engine)
+            cached = _parse_cache_get(key, self)
+            if cached is not None:
+                self.df = cached
+            else:
+                try:
+                    self.df = pd.read_excel(io.BytesIO(data), engine=engine)
+                except Exception as original:
+                    # 个别calamine不支持的xlsx（如非标准写出的工作簿）再用openpyxl试一次；
+                    # 仍然失败时报告calamine原本的错误
+                    if fallback is None or engine == fallback:
+                        raise
+                    try:
+                        self.df = pd.read_excel(io.BytesIO(data), engine=fallback)
+                    except Exception:
+                        raise original from None
+                self._downcast_numeric()
+                self._categorize_strings()
+                _parse_cache_put(key, self.df, self)
+            
+            # 换了文件时放开对上一个文件解析结果的引用
+            if self._parse_key is not None and self._parse_key != key:
+                _parse_cache_release(self._parse_key, self)
+            self._parse_key = key
+            
+            self._mark_modified()
+            self._numeric_cols = self.df.select_dtypes(include=['number']).columns
+            
             self.code_history = [
                 "import pandas as pd",
                 f"# 读取Excel文件",
-                f"df = pd.read_excel('{filename}')"
+                render_code(CODE_READ_EXCEL, filename=filename)
             ]
+            self.code_version += 1
             
             return True, f"成功加载数据，共{self.df.shape[0]}行{self.df.shape[1]}列"
         
         except Exception as e:
             return False, f"文件加载失败: {str(e)}"
     
+    def release(self):
+        """会话被释放时调用：放开对解析缓存的引用"""
+        if self._parse_key is not None:
+            _parse_cache_release(self._parse_key, self)
+            self._parse_key = None
+    
+    def _downcast_numeric(self):
+        """能无损表示的float64列改用float32、int64列改用int32存储，内存和带宽减半"""
+        for col in self.df.select_dtypes(include=['float64']).columns:
+            values = self.df[col].to_numpy()
+            narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed, values, equal_nan=True):
+                self.df[col] = narrowed
+        
+        int32 = np.iinfo(np.int32)
+        for col in self.df.select_dtypes(include=['int64']).columns:
+            values = self.df[col].to_numpy()
+            if len(values) and int32.min <= values.min() and values.max() <= int32.max:
+                self.df[col] = values.astype(np.int32)
+    
+    def _categorize_strings(self):
+        """重复值较多的字符串列改用category存储：按整数编码去重、交叉计数，内存也大幅减少"""
+        # pandas 2.x读入的字符串列是object类型，需按取值推断，混合类型的object列不动
+        for col in self.df.select_dtypes(include=['string', 'object']).columns:
+            series = self.df[col]
+            if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) != 'string':
+                continue
+            if series.nunique(dropna=False) < 0.5 * len(series):
+                self.df[col] = series.astype('category')
+    
+    def _get_numeric_cols(self):
+        """获取数值列索引（带缓存）"""
+        if self._numeric_cols is None:
+            self._numeric_cols = self.df.select_dtypes(include=['number']).columns
+        return self._numeric_cols
+    
+    def _numeric_values(self, copy=False):
+        """把数值列取成一整块float64数组（缺失值为NaN），供向量化计算使用"""
+        numeric_cols = self._get_numeric_cols()
+        return self.df[numeric_cols].to_numpy(dtype=np.float64, na_value=np.nan, copy=copy)
+    
+    def _has_missing(self):
+        """数据中是否含缺失值（带缓存）"""
+        if self._has_na is None:
+            self._has_na = bool(self.df.isna().to_numpy().any())
+        return self._has_na
+    
+    def _numeric_has_missing(self):
+        """数值列中是否含缺失值"""
+        if not self._has_missing():
+            return False
+        return bool(np.isnan(self._numeric_values()).any())
+    
+    def _column_sample(self, column):
+        """取出单列的非缺失值，作为float64数组参与统计"""
+        values = self.df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        return values[~np.isnan(values)]
+    
+    def get_data_info(self):
+        """数据概况：形状、列名和含缺失值各列的缺失数量（同一数据版本只计算一次）"""
+        if self._info_version != self.version:
+            # 逐列直接计数，不生成与整表同样大小的布尔DataFrame；只返回有缺失值的列
+            missing = {}
+            for col, series in self.df.items():
+                count = np.count_nonzero(pd.isna(series.array))
+                if count:
+                    missing[col] = int(count)
+            self._info = {
+                'shape': list(self.df.shape),
+                'columns': self.df.columns.tolist(),
+                'missing_values': missing
+            }
+            self._info_version = self.version
+            # 顺便记下是否含缺失值，后续删除缺失值时无需再扫描
+            self._has_na = bool(missing)
+        return self._info
+    
+    def _mark_modified(self, columns_changed=False, rows_filtered=False):
+        """记录一次数据修改；列集合或列类型可能变化时同时清除数值列缓存"""
+        self.version += 1
+        if columns_changed:
+            self._numeric_cols = None
+        # 只删除行不会引入新的缺失值或重复行，"没有"的结论仍然成立
+        if not rows_filtered or self._has_na:
+            self._has_na = None
+        if not rows_filtered or self._has_duplicates:
+            self._has_duplicates = None
+    
     def handle_missing_values(self, method='drop', fill_value=None):
         """处理缺失值"""
         try:
             original_shape = self.df.shape
             
             if method == 'drop':
-                self.df = self.df.dropna()
-                code = "df = df.dropna()"
+                # 已知没有缺失值时跳过整表扫描和复制
+                if self._has_missing():
+                    self.df = self.df.dropna()
+                    self._mark_modified(rows_filtered=True)
+                    self._has_na = False
+                code = CODE_DROPNA
             elif method == 'mean':
-                numeric_cols = self.df.select_dtypes(include=['number']).columns
-                self.df[numeric_cols] = self.df[numeric_cols].fillna(self.df[numeric_cols].mean())
-                code = "numeric_cols = df.select_dtypes(include=['number']).columns\ndf[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())"
+                # 数值列没有缺失值时不做填充，也不生成填充后的副本
+                if self._numeric_has_missing():
+                    numeric_cols = self._get_numeric_cols()
+                    sub = _widen_float32(self.df[numeric_cols])
+                    self.df[numeric_cols] = sub.fillna(sub.mean())
+                    self._mark_modified()
+                code = CODE_FILL_MEAN
             elif method == 'median':
-                numeric_cols = self.df.select_dtypes(include=['number']).columns
-                self.df[numeric_cols] = self.df[numeric_cols].fillna(self.df[numeric_cols].median())
-                code = "numeric_cols = df.select_dtypes(include=['number']).columns\ndf[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())"
+                if self._numeric_has_missing():
+                    numeric_cols = self._get_numeric_cols()
+                    sub = _widen_float32(self.df[numeric_cols])
+                    self.df[numeric_cols] = sub.fillna(sub.median())
+                    self._mark_modified()
+                code = CODE_FILL_MEDIAN
             elif method == 'value' and fill_value is not None:
-                self.df = self.df.fillna(fill_value)
-                code = f"df = df.fillna({repr(fill_value)})"
+                if self._has_missing():
+                    frame = _widen_float32(self.df)
+                    # category列只能填入已有类别，先把填充值加入类别
+                    for col in frame.select_dtypes(include=['category']).columns:
+                        series = frame[col]
+                        if fill_value not in series.cat.categories and series.hasnans:
+                            frame[col] = series.cat.add_categories([fill_value])
+                    self.df = frame.fillna(fill_value)
+                    # 指定值填充可能改变列类型（如数值列填入字符串）
+                    self._mark_modified(columns_changed=True)
+                    self._has_na = False
+                code = render_code(CODE_FILL_VALUE, fill_value=fill_value)
             else:
                 return False, "无效的缺失值处理方法", ""
             
-            self.code_history.append(f"# 处理缺失值 - {method}")
-            self.code_history.append(code)
+            self._record_code(f"# 处理缺失值 - {method}", code)
             
             new_shape = self.df.shape
             message = f"缺失值处理完成。原始数据: {original_shape[0]}行{original_shape[1]}列，处理后: {new_shape[0]}行{new_shape[1]}列"
@@ -82,49 +536,48 @@ class DataProcessor:
         """处理异常值"""
         try:
             original_shape = self.df.shape
-            numeric_cols = self.df.select_dtypes(include=['number']).columns
+            numeric_cols = self._get_numeric_cols()
             
             if len(numeric_cols) == 0:
                 return False, "没有数值列可以处理异常值", ""
             
             if method == 'iqr':
-                for col in numeric_cols:
-                    Q1 = self.df[col].quantile(0.25)
-                    Q3 = self.df[col].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    self.df = self.df[(self.df[col] >= lower_bound) & (self.df[col] <= upper_bound)]
+                # 一次性计算所有列的边界，再用二维比较得到整行掩码
+                values = self._numeric_values()
+                # 两个分位数一次计算，每列只排序/划分一次
+                Q1, Q3 = np.nanquantile(values, [0.25, 0.75], axis=0)
+                IQR = Q3 - Q1
+                lower_bound = Q1 - 1.5 * IQR
+                upper_bound = Q3 + 1.5 * IQR
+                mask = _row_mask(values, lambda block: (block >= lower_bound) & (block <= upper_bound))
+                self.df = self.df[mask]
                 
-                code = """# IQR方法处理异常值
-numeric_cols = df.select_dtypes(include=['number']).columns
-for col in numeric_cols:
-    Q1 = df[col].quantile(0.25)
-    Q3 = df[col].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    df = df[(df[col] >= lower_bound) & (df[col] <= upper_bound)]"""
+                code = CODE_OUTLIERS_IQR
             
             elif method == 'zscore':
-                for col in numeric_cols:
-                    mean = self.df[col].mean()
-                    std = self.df[col].std()
-                    if std > 0:
-                        z_scores = abs((self.df[col] - mean) / std)
-                        self.df = self.df[z_scores < threshold]
+                # 不生成z分数矩阵，直接比较 |x - mean| < threshold * std
+                values = self._numeric_values()
+                mean, std = _nan_mean_std(values)
+                valid = std > 0
+                if not valid.all():
+                    values, mean, std = values[:, valid], mean[valid], std[valid]
+                limit = threshold * std
                 
-                code = f"""# Z-score方法处理异常值
-numeric_cols = df.select_dtypes(include=['number']).columns
-for col in numeric_cols:
-    mean = df[col].mean()
-    std = df[col].std()
-    if std > 0:
-        z_scores = abs((df[col] - mean) / std)
-        df = df[z_scores < {threshold}]"""
+                def keep(block):
+                    deviation = np.subtract(block, mean)
+                    np.abs(deviation, out=deviation)
+                    return deviation < limit
+                
+                mask = _row_mask(values, keep)
+                self.df = self.df[mask]
+                
+                code = render_code(CODE_OUTLIERS_ZSCORE, threshold=threshold)
+            
+            else:
+                return False, "无效的异常值处理方法", ""
             
-            self.code_history.append(f"# 处理异常值 - {method}")
-            self.code_history.append(code)
+            self._mark_modified(rows_filtered=True)
+            self._record_code(f"# 处理异常值 - {method}", code)
             
             new_shape = self.df.shape
             message = f"异常值处理完成。原始数据: {original_shape[0]}行，处理后: {new_shape[0]}行"
@@ -137,16 +590,22 @@ for col in numeric_cols:
     def handle_duplicates(self):
         """处理重复值"""
         try:
-            original_shape = self.df.shape
-            self.df = self.df.drop_duplicates()
-            new_shape = self.df.shape
+            removed_count = 0
+            # 已知没有重复行时跳过逐行哈希
+            if self._has_duplicates is not False:
+                # 只对每行哈希一次：同一个掩码既用于计数也用于筛选
+                duplicated = self.df.duplicated(keep='first').to_numpy()
+                removed_count = int(np.count_nonzero(duplicated))
+                # 没有重复行时不做筛选复制，数据版本也保持不变
+                if removed_count:
+                    self.df = self.df[~duplicated]
+                    self._mark_modified(rows_filtered=True)
+                self._has_duplicates = False
             
-            code = "df = df.drop_duplicates()"
-            self.code_history.append("# 删除重复行")
-            self.code_history.append(code)
+            code = CODE_DROP_DUPLICATES
+            self._record_code("# 删除重复行", code)
             
-            removed_count = original_shape[0] - new_shape[0]
-            message = f"重复值处理完成。删除了 {removed_count} 行重复数据，剩余 {new_shape[0]} 行"
+            message = f"重复值处理完成。删除了 {removed_count} 行重复数据，剩余 {len(self.df)} 行"
             
             return True, message, code
         
@@ -156,43 +615,39 @@ for col in numeric_cols:
     def standardize_data(self, method='zscore'):
         """数据标准化"""
         try:
-            numeric_cols = self.df.select_dtypes(include=['number']).columns
+            numeric_cols = self._get_numeric_cols()
             
             if len(numeric_cols) == 0:
                 return False, "没有数值列可以标准化", ""
             
+            # 在一块float64副本上原地计算，只写回需要缩放的列
+            values = self._numeric_values(copy=True)
+            
             if method == 'zscore':
-                for col in numeric_cols:
-                    mean = self.df[col].mean()
-                    std = self.df[col].std()
-                    if std > 0:
-                        self.df[col] = (self.df[col] - mean) / std
+                center, scale = _nan_mean_std(values)
                 
-                code = """# Z-score标准化
-numeric_cols = df.select_dtypes(include=['number']).columns
-for col in numeric_cols:
-    mean = df[col].mean()
-    std = df[col].std()
-    if std > 0:
-        df[col] = (df[col] - mean) / std"""
+                code = CODE_STANDARDIZE_ZSCORE
             
             elif method == 'minmax':
-                for col in numeric_cols:
-                    min_val = self.df[col].min()
-                    max_val = self.df[col].max()
-                    if max_val > min_val:
-                        self.df[col] = (self.df[col] - min_val) / (max_val - min_val)
+                # fmin/fmax忽略NaN，全为NaN（或没有行）的列得到NaN，不触发警告
+                center = np.fmin.reduce(values, axis=0, initial=np.nan)
+                scale = np.fmax.reduce(values, axis=0, initial=np.nan) - center
                 
-                code = """# Min-Max标准化
-numeric_cols = df.select_dtypes(include=['number']).columns
-for col in numeric_cols:
-    min_val = df[col].min()
-    max_val = df[col].max()
-    if max_val > min_val:
-        df[col] = (df[col] - min_val) / (max_val - min_val)"""
+                code = CODE_STANDARDIZE_MINMAX
+            
+            else:
+                return False, "无效的标准化方法", ""
             
-            self.code_history.append(f"# 数据标准化 - {method}")
-            self.code_history.append(code)
+            # 标准差或极差为0的列保持不变
+            scaled = scale > 0
+            if not scaled.all():
+                values, center, scale = values[:, scaled], center[scaled], scale[scaled]
+            values -= center
+            values /= scale
+            self.df[numeric_cols[scaled]] = values
+            
+            self._mark_modified()
+            self._record_code(f"# 数据标准化 - {method}", code)
             
             message = f"数据标准化完成，使用{method}方法处理了{len(numeric_cols)}个数值列"
             
@@ -204,26 +659,47 @@ for col in numeric_cols:
     def correlation_analysis(self):
         """相关性分析"""
         try:
-            numeric_cols = self.df.select_dtypes(include=['number']).columns
+            numeric_cols = self._get_numeric_cols()
             
             if len(numeric_cols) < 2:
                 return False, "需要至少2个数值列进行相关性分析", "", False
             
-            corr_matrix = self.df[numeric_cols].corr()
+            values = self._numeric_values()
+            key = _fingerprint(numeric_cols, values)
+            with CORR_CACHE_LOCK:
+                corr = CORR_CACHE.get(key)
+                if corr is not None:
+                    CORR_CACHE.move_to_end(key)
             
-            code = """# 相关性分析
-import pandas as pd
-numeric_cols = df.select_dtypes(include=['number']).columns
-correlation_matrix = df[numeric_cols].corr()
-print(correlation_matrix)"""
+            if corr is None:
+                corr = _pairwise_corr(values)
+                corr.flags.writeable = False
+                with CORR_CACHE_LOCK:
+                    CORR_CACHE[key] = corr
+                    while len(CORR_CACHE) > CORR_CACHE_SIZE:
+                        CORR_CACHE.popitem(last=False)
+            
+            corr_matrix = pd.DataFrame(corr, index=numeric_cols, columns=numeric_cols)
+            
+            # 一次性取出上三角中的强相关列对，避免逐个iloc的双重循环
+            values = corr_matrix.to_numpy()
+            rows, cols = np.triu_indices_from(values, k=1)
+            strong = np.abs(values[rows, cols]) > 0.7
+            strong_pairs = [f"{numeric_cols[i]}-{numeric_cols[j]}" for i, j in zip(rows[strong], cols[strong])]
+            
+            code = CODE_CORRELATION
             
-            self.code_history.append("# 相关性分析")
-            self.code_history.append(code)
+            self._record_code("# 相关性分析", code)
             
             # 创建相关性结果DataFrame
             self.df = corr_matrix.round(4)
+            self._mark_modified(columns_changed=True)
             
             message = f"相关性分析完成，分析了{len(numeric_cols)}个数值列之间的相关性"
+            if strong_pairs:
+                shown = ', '.join(strong_pairs[:5])
+                more = f" 等{len(strong_pairs)}对" if len(strong_pairs) > 5 else ""
+                message += f"；强相关列对(|r|>0.7): {shown}{more}"
             
             return True, message, code, True
         
@@ -231,75 +707,68 @@ print(correlation_matrix)"""
             return False, f"相关性分析失败: {str(e)}", "", False
     
     def t_test(self, column1, column2=None, value=None):
-        """t检验（简化版本，不使用scipy）"""
+        """t检验（简化版本，不使用scipy）；数据未变化时相同参数直接复用上次结果"""
+        try:
+            success, message, code = self._memoized(
+                ('t_test', column1, column2, value, type(value)),
+                lambda: self._compute_t_test(column1, column2, value))
+        except Exception as e:
+            return False, f"t检验失败: {str(e)}", "", False
+        
+        if success:
+            self._record_code("# t检验", code)
+        return success, message, code, False
+    
+    def _compute_t_test(self, column1, column2, value):
+        """计算t统计量，返回 (success, message, code)"""
         try:
             if column1 not in self.df.columns:
-                return False, f"列 '{column1}' 不存在", "", False
+                return False, f"列 '{column1}' 不存在", ""
             
             if not pd.api.types.is_numeric_dtype(self.df[column1]):
-                return False, f"列 '{column1}' 不是数值类型", "", False
+                return False, f"列 '{column1}' 不是数值类型", ""
             
             if column2:  # 双样本t检验
                 if column2 not in self.df.columns:
-                    return False, f"列 '{column2}' 不存在", "", False
+                    return False, f"列 '{column2}' 不存在", ""
                 
                 if not pd.api.types.is_numeric_dtype(self.df[column2]):
-                    return False, f"列 '{column2}' 不是数值类型", "", False
+                    return False, f"列 '{column2}' 不是数值类型", ""
                 
-                sample1 = self.df[column1].dropna()
-                sample2 = self.df[column2].dropna()
+                sample1 = self._column_sample(column1)
+                sample2 = self._column_sample(column2)
                 
                 mean1, mean2 = sample1.mean(), sample2.mean()
-                var1, var2 = sample1.var(), sample2.var()
+                var1, var2 = sample1.var(ddof=1), sample2.var(ddof=1)
                 n1, n2 = len(sample1), len(sample2)
                 
                 # 简化的t统计量计算
                 pooled_var = ((n1-1)*var1 + (n2-1)*var2) / (n1+n2-2)
                 t_stat = (mean1 - mean2) / math.sqrt(pooled_var * (1/n1 + 1/n2))
                 
-                code = f"""# 双样本t检验 (简化版本)
-import math
-sample1 = df['{column1}'].dropna()
-sample2 = df['{column2}'].dropna()
-mean1, mean2 = sample1.mean(), sample2.mean()
-var1, var2 = sample1.var(), sample2.var()
-n1, n2 = len(sample1), len(sample2)
-pooled_var = ((n1-1)*var1 + (n2-1)*var2) / (n1+n2-2)
-t_statistic = (mean1 - mean2) / math.sqrt(pooled_var * (1/n1 + 1/n2))
-print(f'T统计量: {{t_statistic:.4f}}')"""
+                code = render_code(CODE_T_TEST_TWO_SAMPLE, column1=column1, column2=column2)
                 
                 message = f"双样本t检验完成。T统计量: {t_stat:.4f}, 样本1均值: {mean1:.4f}, 样本2均值: {mean2:.4f}"
                 
             else:  # 单样本t检验
                 if value is None:
-                    return False, "单样本t检验需要指定检验值", "", False
+                    return False, "单样本t检验需要指定检验值", ""
                 
-                sample = self.df[column1].dropna()
+                sample = self._column_sample(column1)
                 mean = sample.mean()
-                std = sample.std()
+                std = sample.std(ddof=1)
                 n = len(sample)
                 
                 t_stat = (mean - value) / (std / math.sqrt(n))
                 
-                code = f"""# 单样本t检验 (简化版本)
-import math
-sample = df['{column1}'].dropna()
-mean = sample.mean()
-std = sample.std()
-n = len(sample)
-test_value = {value}
-t_statistic = (mean - test_value) / (std / math.sqrt(n))
-print(f'T统计量: {{t_statistic:.4f}}')"""
+                code = render_code(CODE_T_TEST_ONE_SAMPLE, column1=column1, value=value)
                 
                 message = f"单样本t检验完成。T统计量: {t_stat:.4f}, 样本均值: {mean:.4f}, 检验值: {value}"
             
-            self.code_history.append("# t检验")
-            self.code_history.append(code)
-            
-            return True, message, code, False
+            return True, message, code
         
         except Exception as e:
-            return False, f"t检验失败: {str(e)}", "", False
+            return False, f"t检验失败: {str(e)}", ""
     
     def chi_square_test(self, column1, column2):
         """卡方检验（简化版本，不使用scipy）"""
@@ -307,44 +776,47 @@ print(f'T统计量: {{t_statistic:.4f}}')"""
             if column1 not in self.df.columns or column2 not in self.df.columns:
                 return False, "指定的列不存在", "", False
             
-            # 创建交叉表
-            contingency_table = pd.crosstab(self.df[column1], self.df[column2])
-            
-            # 简化的卡方统计量计算
-            row_totals = contingency_table.sum(axis=1)
-            col_totals = contingency_table.sum(axis=0)
-            total = contingency_table.sum().sum()
-            
-            chi_square = 0
-            for i in range(len(row_totals)):
-                for j in range(len(col_totals)):
-                    observed = contingency_table.iloc[i, j]
-                    expected = (row_totals.iloc[i] * col_totals.iloc[j]) / total
-                    if expected > 0:
-                        chi_square += (observed - expected) ** 2 / expected
-            
-            code = f"""# 卡方检验 (简化版本)
-contingency_table = pd.crosstab(df['{column1}'], df['{column2}'])
-row_totals = contingency_table.sum(axis=1)
-col_totals = contingency_table.sum(axis=0)
-total = contingency_table.sum().sum()
-
-chi_square = 0
-for i in range(len(row_totals)):
-    for j in range(len(col_totals)):
-        observed = contingency_table.iloc[i, j]
-        expected = (row_totals.iloc[i] * col_totals.iloc[j]) / total
-        if expected > 0:
-            chi_square += (observed - expected) ** 2 / expected
-
-print(f'卡方统计量: {{chi_square:.4f}}')
-print(contingency_table)"""
-            
-            self.code_history.append("# 卡方检验")
-            self.code_history.append(code)
+            # 两列各编码一次，再用bincount计数得到列联表（与crosstab一致：排序、忽略缺失）
+            # 两列可以是同一列，因此不取 df[[column1, column2]]（那样会得到两列同名的DataFrame）
+            series1, series2 = self.df[column1], self.df[column2]
+            valid = series1.notna() & series2.notna()
+            codes1, uniques1 = pd.factorize(series1[valid], sort=True)
+            if column2 == column1:
+                codes2, uniques2 = codes1, uniques1
+            else:
+                codes2, uniques2 = pd.factorize(series2[valid], sort=True)
+            n_rows, n_cols = len(uniques1), len(uniques2)
+            if n_rows * n_cols > MAX_CONTINGENCY_CELLS:
+                return False, f"列联表过大（{n_rows}×{n_cols}），请选择类别较少的列", "", False
+            
+            counts = np.bincount(codes1 * n_cols + codes2, minlength=n_rows * n_cols)
+            contingency_table = pd.DataFrame(
+                counts.reshape(n_rows, n_cols),
+                index=pd.Index(uniques1, name=column1),
+                columns=pd.Index(uniques2, name=column2),
+            )
+            
+            # 简化的卡方统计量计算：利用恒等式 χ² = N·(Σ O²/(行合计·列合计) − 1)，
+            # 只遍历非零单元格，不生成期望频数和差值这些与列联表同样大小的中间矩阵
+            row_totals = np.bincount(codes1, minlength=n_rows)
+            col_totals = np.bincount(codes2, minlength=n_cols)
+            total = len(codes1)
+            
+            chi_square = 0.0
+            if total > 0:
+                cells = np.flatnonzero(counts)
+                rows, cols = np.divmod(cells, n_cols)
+                observed = counts[cells].astype(np.float64)
+                ratio = observed * observed / (row_totals[rows] * col_totals[cols])
+                chi_square = max(float(total * (ratio.sum() - 1.0)), 0.0)
+            
+            code = render_code(CODE_CHI_SQUARE, column1=column1, column2=column2)
+            
+            self._record_code("# 卡方检验", code)
             
             # 将交叉表作为结果
             self.df = contingency_table
+            self._mark_modified(columns_changed=True)
             
             message = f"卡方检验完成。卡方统计量: {chi_square:.4f}"
             
@@ -353,23 +825,100 @@ print(contingency_table)"""
         except Exception as e:
             return False, f"卡方检验失败: {str(e)}", "", False
     
+    def _memoized(self, key, compute):
+        """按数据版本缓存只读分析的结果：self.df未变化时相同的key直接返回上次结果"""
+        if self._results_version != self.version:
+            self._results.clear()
+            self._results_version = self.version
+        result = self._results.get(key)
+        if result is None:
+            result = compute()
+            self._results[key] = result
+            while len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(key)
+        return result
+    
+    def _record_code(self, title, code):
+        """追加一段操作代码（注释标题 + 代码）"""
+        self.code_history.append(title)
+        self.code_history.append(code)
+        self.code_version += 1
+    
     def get_complete_code(self):
-        """获取完整的Python代码"""
-        return "\n".join(self.code_history)
+        """获取完整的Python代码（代码未变化时直接返回上次拼接的结果）"""
+        if self._complete_code_version != self.code_version:
+            self._complete_code = "\n".join(self.code_history)
+            self._complete_code_version = self.code_version
+        return self._complete_code
     
     def to_excel(self):
-        """导出为Excel"""
+        """导出为Excel（同一数据版本只生成一次）"""
         try:
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                self.df.to_excel(writer, index=False, sheet_name='processed_data')
-            output.seek(0)
-            return output
+            if self._excel_version != self.version:
+                output = io.BytesIO()
+                with pd.ExcelWriter(output, engine=EXCEL_WRITER_ENGINE, engine_kwargs=EXCEL_WRITER_KWARGS) as writer:
+                    self.df.to_excel(writer, index=False, sheet_name='processed_data')
+                self._excel = output.getvalue()
+                self._excel_version = self.version
+            return io.BytesIO(self._excel)
         except Exception as e:
             raise Exception(f"导出Excel失败: {str(e)}")
 
-# 创建全局处理器实例
-processor = DataProcessor()
+# 按会话隔离的处理器注册表：job_id -> (DataProcessor, 最近访问时间)
+# job_id 在上传时签发并写入cookie，并发用户不再共享同一个DataFrame
+# 按最近访问排序：闲置超过JOB_TTL秒或总数超过MAX_JOBS时，从最久未用的会话开始释放
+JOB_COOKIE = 'job_id'
+JOB_TTL = 30 * 60
+MAX_JOBS = 64
+JOBS = OrderedDict()
+JOBS_LOCK = threading.Lock()
+
+def _evict_jobs(now):
+    """移除过期会话，并把会话数限制在MAX_JOBS以内，返回被移除的处理器（调用方持有JOBS_LOCK）"""
+    evicted = []
+    while JOBS:
+        _, last_used = next(iter(JOBS.values()))
+        if now - last_used <= JOB_TTL and len(JOBS) <= MAX_JOBS:
+            break
+        _, (processor, _) = JOBS.popitem(last=False)
+        evicted.append(processor)
+    return evicted
+
+def _release_processor(processor):
+    """持有处理器的锁释放其资源，不与该会话上仍在进行的上传或处理交错"""
+    with processor.lock:
+        processor.release()
+
+def get_processor(processor=None):
+    """获取当前会话的处理器；当前请求没有会话时，传入processor则将其登记为新会话"""
+    job_id = request.cookies.get(JOB_COOKIE)
+    now = time.monotonic()
+    with JOBS_LOCK:
+        entry = JOBS.get(job_id) if job_id else None
+        if entry is not None:
+            processor = entry[0]
+            JOBS.move_to_end(job_id)
+        elif processor is not None:
+            job_id = uuid.uuid4().hex
+        if processor is not None:
+            JOBS[job_id] = (processor, now)
+        evicted = _evict_jobs(now)
+    # 在JOBS_LOCK之外等待各处理器的锁，其他会话的请求不被阻塞
+    for old in evicted:
+        _release_processor(old)
+    if processor is not None:
+        g.job_id = job_id
+    return processor
+
+def drop_processor():
+    """删除当前会话的处理器"""
+    job_id = request.cookies.get(JOB_COOKIE)
+    with JOBS_LOCK:
+        entry = JOBS.pop(job_id, None)
+    if entry is not None:
+        _release_processor(entry[0])
 
 # HTML模板（内联）
 HTML_TEMPLATE = '''
@@ -381,6 +930,7 @@ HTML_TEMPLATE = '''
     <title>数据预处理在线工具</title>
     <link href="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.1.3/css/bootstrap.min.css" rel="stylesheet">
     <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
+    <link href="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.1.3/js/bootstrap.bundle.min.js" rel="preload" as="script">
     <style>
         .drag-area {
             border: 2px dashed #007bff;
@@ -438,8 +988,8 @@ HTML_TEMPLATE = '''
         .form-control, .form-select {
             border-radius: 10px;
         }
-        .hide-element {
-            display: none !important;
+        #resultMessage {
+            white-space: pre-line;
         }
     </style>
 </head>
@@ -460,13 +1010,13 @@ HTML_TEMPLATE = '''
                             <i class="fas fa-cloud-upload-alt fa-3x text-primary mb-3"></i>
                             <h6>拖拽Excel文件到此处，或点击选择文件</h6>
                             <p class="text-muted">支持 .xlsx 和 .xls 格式，最大16MB</p>
-                            <input type="file" id="fileInput" accept=".xlsx,.xls" style="display: none;">
+                            <input type="file" id="fileInput" accept=".xlsx,.xls" hidden>
                         </div>
                     </div>
                 </div>
 
                 <!-- 数据信息展示 -->
-                <div class="card mb-4 hide-element" id="dataInfoCard">
+                <div class="card mb-4" id="dataInfoCard" hidden>
                     <div class="card-body">
                         <h5 class="card-title"><i class="fas fa-info-circle"></i> 数据信息</h5>
                         <div id="dataInfo"></div>
@@ -474,7 +1024,7 @@ HTML_TEMPLATE = '''
                 </div>
 
                 <!-- 功能选择区域 -->
-                <div class="card mb-4 hide-element" id="functionsCard">
+                <div class="card mb-4" id="functionsCard" hidden>
                     <div class="card-body">
                         <h5 class="card-title"><i class="fas fa-cogs"></i> 选择处理功能</h5>
                         
@@ -660,7 +1210,7 @@ HTML_TEMPLATE = '''
                 </div>
 
                 <!-- 处理结果 -->
-                <div class="card hide-element" id="resultCard">
+                <div class="card" id="resultCard" hidden>
                     <div class="card-body">
                         <div class="d-flex justify-content-between align-items-center mb-3">
                             <h5 class="card-title mb-0"><i class="fas fa-check-circle text-success"></i> 处理结果</h5>
@@ -689,22 +1239,28 @@ HTML_TEMPLATE = '''
         </div>
     </div>
 
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.1.3/js/bootstrap.bundle.min.js"></script>
+    <!-- 只有标签页切换依赖Bootstrap脚本：头部预加载，defer执行，页面脚本不必等它下载完成 -->
+    <script src="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.1.3/js/bootstrap.bundle.min.js" defer></script>
     <script>
         let currentDataInfo = null;
 
-        document.addEventListener('DOMContentLoaded', function() {
-            const fileInput = document.getElementById('fileInput');
-            const missingMethod = document.getElementById('missingMethod');
-            const outlierMethod = document.getElementById('outlierMethod');
-            const tTestType = document.getElementById('tTestType');
-            
-            fileInput.addEventListener('change', handleFileSelect);
-            missingMethod.addEventListener('change', toggleFillValue);
-            outlierMethod.addEventListener('change', toggleThreshold);
-            tTestType.addEventListener('change', toggleTTestInputs);
+        // 页面元素引用只查找一次（脚本位于body末尾，此时元素均已存在）
+        const els = {};
+        [
+            'fileInput', 'dragArea', 'dataInfo', 'dataInfoCard', 'functionsCard',
+            'missingMethod', 'fillValue', 'outlierMethod', 'zscoreThreshold', 'standardMethod',
+            'tTestType', 'tTestCol1', 'tTestCol2', 'tTestValue', 'chiCol1', 'chiCol2',
+            'resultCard', 'resultMessage', 'pythonCode', 'downloadBtn'
+        ].forEach(id => {
+            els[id] = document.getElementById(id);
         });
 
+        // 直接绑定，不等DOMContentLoaded（它要等defer的Bootstrap执行完）：拖拽区一可点击，选择文件就能处理
+        els.fileInput.addEventListener('change', handleFileSelect);
+        els.missingMethod.addEventListener('change', toggleFillValue);
+        els.outlierMethod.addEventListener('change', toggleThreshold);
+        els.tTestType.addEventListener('change', toggleTTestInputs);
+
         function handleFileSelect(e) {
             const file = e.target.files[0];
             if (file) {
@@ -723,19 +1279,14 @@ HTML_TEMPLATE = '''
                 return;
             }
 
-            const reader = new FileReader();
-            reader.onload = function(e) {
-                const fileContent = e.target.result;
-                uploadFile(fileContent, file.name);
-            };
-            reader.readAsDataURL(file);
+            uploadFile(file);
         }
 
         // 拖拽功能
-        const dragArea = document.getElementById('dragArea');
+        const dragArea = els.dragArea;
         
         dragArea.addEventListener('click', () => {
-            document.getElementById('fileInput').click();
+            els.fileInput.click();
         });
 
         dragArea.addEventListener('dragover', (e) => {
@@ -757,23 +1308,31 @@ HTML_TEMPLATE = '''
             }
         });
 
-        async function uploadFile(fileContent, filename) {
+        async function uploadFile(file) {
             try {
+                if (resetRequest) {
+                    await resetRequest;
+                    resetRequest = null;
+                }
+                // 以multipart形式直接发送原始文件，不做base64编码
+                const formData = new FormData();
+                formData.append('file', file, file.name);
                 const response = await fetch('/upload', {
                     method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        file_content: fileContent,
-                        filename: filename
-                    })
+                    body: formData
                 });
 
                 const data = await response.json();
                 
                 if (data.success) {
                     currentDataInfo = data.data_info;
+                    dataVersion = data.data_version;
+                    // 会话过期或冷启动后新会话的版本号从头计数，可能与旧文件的版本相同：缓存的下载和代码都不能沿用
+                    codeVersion = null;
+                    if (download) {
+                        window.URL.revokeObjectURL(download.url);
+                        download = null;
+                    }
                     showDataInfo(data.data_info);
                     showFunctionCards();
                     populateColumnSelects();
@@ -785,7 +1344,18 @@ HTML_TEMPLATE = '''
             }
         }
 
+        const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+
+        // 列名来自用户文件，插入innerHTML前必须转义
+        function escapeHtml(value) {
+            return String(value).replace(/[&<>"']/g, ch => HTML_ESCAPES[ch]);
+        }
+
         function showDataInfo(info) {
+            // 服务端只返回缺失数量大于0的列
+            const missing = Object.entries(info.missing_values)
+                .map(([col, count]) => `${escapeHtml(col)}: ${count}`)
+                .join(', ');
             const html = `
                 <div class="row">
                     <div class="col-md-4">
@@ -794,54 +1364,55 @@ HTML_TEMPLATE = '''
                     </div>
                     <div class="col-md-4">
                         <h6>列名</h6>
-                        <p class="text-secondary">${info.columns.join(', ')}</p>
+                        <p class="text-secondary">${info.columns.map(escapeHtml).join(', ')}</p>
                     </div>
                     <div class="col-md-4">
                         <h6>缺失值统计</h6>
-                        <p class="text-warning">${Object.entries(info.missing_values).map(([col, count]) => count > 0 ? `${col}: ${count}` : '').filter(Boolean).join(', ') || '无缺失值'}</p>
+                        <p class="text-warning">${missing || '无缺失值'}</p>
                     </div>
                 </div>
             `;
             
-            document.getElementById('dataInfo').innerHTML = html;
-            document.getElementById('dataInfoCard').classList.remove('hide-element');
+            els.dataInfo.innerHTML = html;
+            els.dataInfoCard.hidden = false;
         }
 
         function showFunctionCards() {
-            document.getElementById('functionsCard').classList.remove('hide-element');
+            els.functionsCard.hidden = false;
         }
 
         function populateColumnSelects() {
             if (!currentDataInfo) return;
             
-            const columns = currentDataInfo.columns;
+            // 直接创建option节点（不经HTML解析，列名也无需转义），每个下拉框整体替换一次
+            const options = document.createDocumentFragment();
+            options.appendChild(new Option('请选择列', ''));
+            currentDataInfo.columns.forEach(col => {
+                options.appendChild(new Option(col, col));
+            });
             const selects = ['tTestCol1', 'tTestCol2', 'chiCol1', 'chiCol2'];
             
             selects.forEach(selectId => {
-                const select = document.getElementById(selectId);
-                select.innerHTML = '<option value="">请选择列</option>';
-                columns.forEach(col => {
-                    select.innerHTML += `<option value="${col}">${col}</option>`;
-                });
+                els[selectId].replaceChildren(options.cloneNode(true));
             });
         }
 
         function toggleFillValue() {
-            const method = document.getElementById('missingMethod').value;
-            const fillValueInput = document.getElementById('fillValue');
+            const method = els.missingMethod.value;
+            const fillValueInput = els.fillValue;
             fillValueInput.disabled = method !== 'value';
         }
 
         function toggleThreshold() {
-            const method = document.getElementById('outlierMethod').value;
-            const thresholdInput = document.getElementById('zscoreThreshold');
+            const method = els.outlierMethod.value;
+            const thresholdInput = els.zscoreThreshold;
             thresholdInput.disabled = method !== 'zscore';
         }
 
         function toggleTTestInputs() {
-            const testType = document.getElementById('tTestType').value;
-            const col2Select = document.getElementById('tTestCol2');
-            const valueInput = document.getElementById('tTestValue');
+            const testType = els.tTestType.value;
+            const col2Select = els.tTestCol2;
+            const valueInput = els.tTestValue;
             
             if (testType === 'two_sample') {
                 col2Select.disabled = false;
@@ -852,29 +1423,75 @@ HTML_TEMPLATE = '''
             }
         }
 
-        async function processData(operation, parameters) {
+        // 同一时间只允许一个处理请求：请求进行中时忽略重复点击并禁用处理按钮
+        let processing = false;
+        const processButtons = els.functionsCard.querySelectorAll('button.btn-custom');
+
+        function setProcessing(active) {
+            processing = active;
+            processButtons.forEach(button => {
+                button.disabled = active;
+            });
+        }
+
+        // 连续点击的操作先排队，停顿BATCH_DELAY_MS后合并为一次 /process_batch 请求；
+        // 从第一次点击算起最多等待BATCH_MAX_WAIT_MS
+        const BATCH_DELAY_MS = 150;
+        const BATCH_MAX_WAIT_MS = 600;
+        // 与服务端MAX_BATCH_OPS一致，攒满即发送
+        const BATCH_MAX_OPS = 16;
+        let pendingOps = [];
+        let batchStarted = 0;
+        let flushTimer = null;
+
+        function processData(operation, parameters) {
+            if (processing) {
+                return;
+            }
+            const op = JSON.stringify({ operation: operation, parameters: parameters });
+            // 连击同一按钮（参数相同）只执行一次
+            if (pendingOps[pendingOps.length - 1] === op) {
+                return;
+            }
+            if (pendingOps.length === 0) {
+                batchStarted = Date.now();
+            }
+            pendingOps.push(op);
+            clearTimeout(flushTimer);
+            if (pendingOps.length >= BATCH_MAX_OPS) {
+                flushOps();
+                return;
+            }
+            const wait = Math.min(BATCH_DELAY_MS, batchStarted + BATCH_MAX_WAIT_MS - Date.now());
+            flushTimer = setTimeout(flushOps, Math.max(0, wait));
+        }
+
+        async function flushOps() {
+            const operations = pendingOps;
+            pendingOps = [];
+            flushTimer = null;
+            setProcessing(true);
             try {
-                const response = await fetch('/process', {
+                const response = await fetch('/process_batch', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify({
-                        operation: operation,
-                        parameters: parameters
-                    })
+                    body: '{"operations":[' + operations.join(',') + ']}'
                 });
 
                 const data = await response.json();
-                showResult(data);
+                await showResult(data);
             } catch (error) {
                 alert('处理过程中发生错误: ' + error.message);
+            } finally {
+                setProcessing(false);
             }
         }
 
         function processMissingValues() {
-            const method = document.getElementById('missingMethod').value;
-            const fillValue = document.getElementById('fillValue').value;
+            const method = els.missingMethod.value;
+            const fillValue = els.fillValue.value;
             
             const params = { method: method };
             if (method === 'value' && fillValue) {
@@ -885,8 +1502,8 @@ HTML_TEMPLATE = '''
         }
 
         function processOutliers() {
-            const method = document.getElementById('outlierMethod').value;
-            const threshold = parseFloat(document.getElementById('zscoreThreshold').value);
+            const method = els.outlierMethod.value;
+            const threshold = parseFloat(els.zscoreThreshold.value);
             
             processData('outliers', { method: method, threshold: threshold });
         }
@@ -896,7 +1513,7 @@ HTML_TEMPLATE = '''
         }
 
         function processStandardization() {
-            const method = document.getElementById('standardMethod').value;
+            const method = els.standardMethod.value;
             processData('standardization', { method: method });
         }
 
@@ -905,10 +1522,10 @@ HTML_TEMPLATE = '''
         }
 
         function processTTest() {
-            const testType = document.getElementById('tTestType').value;
-            const col1 = document.getElementById('tTestCol1').value;
-            const col2 = document.getElementById('tTestCol2').value;
-            const value = document.getElementById('tTestValue').value;
+            const testType = els.tTestType.value;
+            const col1 = els.tTestCol1.value;
+            const col2 = els.tTestCol2.value;
+            const value = els.tTestValue.value;
             
             if (!col1) {
                 alert('请选择列1');
@@ -935,8 +1552,8 @@ HTML_TEMPLATE = '''
         }
 
         function processChiSquare() {
-            const col1 = document.getElementById('chiCol1').value;
-            const col2 = document.getElementById('chiCol2').value;
+            const col1 = els.chiCol1.value;
+            const col2 = els.chiCol2.value;
             
             if (!col1 || !col2) {
                 alert('请选择两个列');
@@ -946,95 +1563,278 @@ HTML_TEMPLATE = '''
             processData('chi_square', { column1: col1, column2: col2 });
         }
 
-        function showResult(data) {
-            if (data.success) {
-                document.getElementById('resultMessage').textContent = data.message;
-                document.getElementById('pythonCode').textContent = data.code;
+        let codeVersion = null;
+        // 当前数据版本；下载得到的Blob URL按数据版本缓存，数据未变时重复下载不再请求
+        let dataVersion = null;
+        let download = null;
+
+        async function refreshCode(data) {
+            const codeBlock = els.pythonCode;
+            if (data.code_version === codeVersion) {
+                return;
+            }
+            if (codeVersion !== null && data.previous_code_version === codeVersion) {
+                // 只是在当前代码后新增了代码：直接追加，无需重新获取完整代码
+                codeBlock.textContent += '\\n' + data.code;
+                codeVersion = data.code_version;
+                return;
+            }
+            const response = await fetch('/code');
+            if (response.ok) {
+                const result = await response.json();
+                codeBlock.textContent = result.code;
+                codeVersion = result.code_version;
+            }
+        }
+
+        async function showResult(data) {
+            // 批量执行中途失败时，之前成功的步骤已经生效，照常显示它们的结果
+            const done = (data.results || []).filter(result => result.success);
+            if (done.length > 0) {
+                els.resultMessage.textContent = done.map(result => result.message).join('\\n');
+                await refreshCode(data);
+                dataVersion = data.data_version;
                 
-                const downloadBtn = document.getElementById('downloadBtn');
-                if (data.can_download) {
-                    downloadBtn.style.display = 'block';
-                } else {
-                    downloadBtn.style.display = 'none';
-                }
+                els.downloadBtn.hidden = !done[done.length - 1].can_download;
                 
-                document.getElementById('resultCard').classList.remove('hide-element');
-                document.getElementById('resultCard').scrollIntoView({ behavior: 'smooth' });
-            } else {
+                els.resultCard.hidden = false;
+                els.resultCard.scrollIntoView({ behavior: 'smooth' });
+            }
+            if (!data.success) {
                 alert('处理失败: ' + data.message);
             }
         }
 
+        // 下载文件名带本地时间戳，在客户端生成
+        function downloadName() {
+            const now = new Date();
+            const pad = n => String(n).padStart(2, '0');
+            const date = `${now.getFullYear()}${pad(now.getMonth() + 1)}${pad(now.getDate())}`;
+            const time = `${pad(now.getHours())}${pad(now.getMinutes())}${pad(now.getSeconds())}`;
+            return `processed_data_${date}_${time}.xlsx`;
+        }
+
         async function downloadResult() {
             try {
-                const response = await fetch('/download');
-                if (response.ok) {
+                if (!download || download.version !== dataVersion) {
+                    const version = dataVersion;
+                    const name = downloadName();
+                    // 文件名由下面的a.download指定；URL保持不变，浏览器缓存才能凭ETag重新验证
+                    const response = await fetch('/download');
+                    if (!response.ok) {
+                        alert('下载失败');
+                        return;
+                    }
                     const blob = await response.blob();
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.style.display = 'none';
-                    a.href = url;
-                    a.download = 'processed_data.xlsx';
-                    document.body.appendChild(a);
-                    a.click();
-                    window.URL.revokeObjectURL(url);
-                    document.body.removeChild(a);
-                } else {
-                    alert('下载失败');
+                    // 旧版本的Blob URL在被替换时才释放
+                    if (download) {
+                        window.URL.revokeObjectURL(download.url);
+                    }
+                    download = { version: version, name: name, url: window.URL.createObjectURL(blob) };
                 }
+                const a = document.createElement('a');
+                a.hidden = true;
+                a.href = download.url;
+                a.download = download.name;
+                document.body.appendChild(a);
+                a.click();
+                document.body.removeChild(a);
             } catch (error) {
                 alert('下载过程中发生错误: ' + error.message);
             }
         }
 
         function copyCode() {
-            const codeText = document.getElementById('pythonCode').textContent;
-            navigator.clipboard.writeText(codeText).then(() => {
+            const codeBlock = els.pythonCode;
+            // 非HTTPS页面没有navigator.clipboard，退回到选中代码块后execCommand复制
+            if (!navigator.clipboard) {
+                copyCodeBySelection(codeBlock);
+                return;
+            }
+            navigator.clipboard.writeText(codeBlock.textContent).then(() => {
                 alert('代码已复制到剪贴板');
             }).catch(() => {
-                alert('复制失败，请手动选择代码');
+                copyCodeBySelection(codeBlock);
             });
         }
 
-        async function resetProcessor() {
+        function copyCodeBySelection(codeBlock) {
+            const selection = window.getSelection();
+            const range = document.createRange();
+            range.selectNodeContents(codeBlock);
+            selection.removeAllRanges();
+            selection.addRange(range);
+            let copied = false;
             try {
-                await fetch('/reset', { method: 'POST' });
-                location.reload();
+                copied = document.execCommand('copy');
             } catch (error) {
-                location.reload();
+                copied = false;
+            }
+            selection.removeAllRanges();
+            alert(copied ? '代码已复制到剪贴板' : '复制失败，请手动选择代码');
+        }
+
+        // 重置只清空页面状态，不再整页刷新；之后的上传会等重置请求完成再发送
+        let resetRequest = null;
+
+        function resetProcessor() {
+            resetRequest = fetch('/reset', { method: 'POST' }).catch(() => location.reload());
+            
+            clearTimeout(flushTimer);
+            pendingOps = [];
+            currentDataInfo = null;
+            codeVersion = null;
+            dataVersion = null;
+            if (download) {
+                window.URL.revokeObjectURL(download.url);
+                download = null;
             }
+            
+            els.fileInput.value = '';
+            els.dataInfo.innerHTML = '';
+            els.resultMessage.textContent = '';
+            els.pythonCode.textContent = '';
+            els.dataInfoCard.hidden = true;
+            els.functionsCard.hidden = true;
+            els.resultCard.hidden = true;
+            window.scrollTo({ top: 0, behavior: 'smooth' });
         }
     </script>
 </body>
 </html>
 '''
 
+# 页面不含动态内容，导入时渲染并压缩一次，请求时直接返回字节
+INDEX_HTML = app.jinja_env.from_string(HTML_TEMPLATE).render()
+INDEX_BYTES = INDEX_HTML.encode('utf-8')
+INDEX_GZIP = gzip.compress(INDEX_BYTES, compresslevel=9, mtime=0)
+INDEX_ETAG = hashlib.sha1(INDEX_BYTES).hexdigest()
+
+# 安装了brotli时额外准备br压缩版本（比gzip更小），未安装时只提供gzip
+try:
+    import brotli
+    INDEX_BROTLI = brotli.compress(INDEX_BYTES, quality=11)
+except ImportError:
+    INDEX_BROTLI = None
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    encodings = request.accept_encodings
+    if INDEX_BROTLI is not None and encodings['br'] > 0:
+        body, encoding = INDEX_BROTLI, 'br'
+    elif encodings['gzip'] > 0:
+        body, encoding = INDEX_GZIP, 'gzip'
+    else:
+        body, encoding = INDEX_BYTES, None
+    response = Response(body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 页面内容不变时浏览器凭ETag得到304，不再重复下载；每种压缩表示的ETag各不相同
+    response.set_etag(f"{INDEX_ETAG}-{encoding}" if encoding else INDEX_ETAG)
+    # 浏览器每次凭ETag重新验证（页面随部署更新，不能长期缓存）；
+    # CDN边缘节点可长期缓存，Vercel每次部署会清空边缘缓存
+    response.headers['Cache-Control'] = 'public, max-age=0, s-maxage=31536000'
+    return response.make_conditional(request)
+
+@app.errorhandler(413)
+def file_too_large(e):
+    # 超过MAX_CONTENT_LENGTH时Werkzeug在读取请求体途中即中止，这里只把413改为JSON提示
+    return jsonify({'success': False, 'message': '文件过大，不能超过16MB'}), 413
+
+@app.errorhandler(503)
+def server_busy(e):
+    response = jsonify({'success': False, 'message': '服务器繁忙，请稍后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(PROCESS_RETRY_AFTER)
+    return response
+
+@contextmanager
+def processing_slot():
+    """占用一个数据处理名额，等待超时则以503拒绝请求"""
+    if not PROCESS_SLOTS.acquire(timeout=PROCESS_SLOT_WAIT):
+        raise ServiceUnavailable()
+    try:
+        yield
+    finally:
+        PROCESS_SLOTS.release()
+
+@app.after_request
+def set_job_cookie(response):
+    job_id = g.get('job_id')
+    if job_id and request.cookies.get(JOB_COOKIE) != job_id:
+        response.set_cookie(JOB_COOKIE, job_id, httponly=True, samesite='Lax')
+    return response
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
-        data = request.json
-        file_content = data.get('file_content')
-        filename = data.get('filename')
+        # 先接收完请求体，再占用处理名额，慢速上传不会占着名额
+        uploaded = request.files.get('file')
+        if uploaded is None:
+            return jsonify({'success': False, 'message': '请选择要上传的文件'})
         
-        success, message = processor.load_data_from_base64(file_content, filename)
+        processor = get_processor()
+        new_session = processor is None
+        if new_session:
+            processor = DataProcessor()
         
-        if success:
-            info = {
-                'shape': list(processor.df.shape),
-                'columns': list(processor.df.columns),
-                'missing_values': {k: int(v) for k, v in processor.df.isnull().sum().to_dict().items()}
-            }
-            return jsonify({'success': True, 'message': message, 'data_info': info})
-        else:
-            return jsonify({'success': False, 'message': message})
+        with processor.lock, processing_slot():
+            # multipart上传：直接把文件流交给pandas
+            success, message = processor.load_data_from_stream(uploaded.stream, uploaded.filename)
+            
+            if not success:
+                if new_session:
+                    processor.release()
+                return jsonify({'success': False, 'message': message})
+            data_info = processor.get_data_info()
+            data_version = processor.version
+        
+        # 解析成功后才登记新会话：过大、缺少文件或解析失败的上传不占用会话名额
+        if new_session:
+            get_processor(processor)
+        return jsonify({
+            'success': True,
+            'message': message,
+            'data_info': data_info,
+            'data_version': data_version
+        })
     
+    except (RequestEntityTooLarge, ServiceUnavailable):
+        # 413/503交给对应的错误处理器统一返回，其他错误仍按JSON返回
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'上传失败: {str(e)}'})
 
+# 操作名 -> 处理函数，统一返回 (success, message, code, can_download)
+OPERATIONS = {
+    'missing_values': lambda processor, params: (
+        *processor.handle_missing_values(params.get('method', 'drop'), params.get('fill_value')), True),
+    'outliers': lambda processor, params: (
+        *processor.handle_outliers(params.get('method', 'iqr'), params.get('threshold', 3)), True),
+    'duplicates': lambda processor, params: (*processor.handle_duplicates(), True),
+    'standardization': lambda processor, params: (
+        *processor.standardize_data(params.get('method', 'zscore')), True),
+    'correlation': lambda processor, params: processor.correlation_analysis(),
+    't_test': lambda processor, params: processor.t_test(
+        params.get('column1'), params.get('column2'), params.get('value')),
+    'chi_square': lambda processor, params: processor.chi_square_test(
+        params.get('column1'), params.get('column2')),
+}
+
+def run_operation(processor, operation, params):
+    """执行一个处理操作，返回 (success, message, can_download)；调用方需持有processor.lock"""
+    handler = OPERATIONS.get(operation)
+    if handler is None:
+        success, message, code, can_download = False, "", "", True
+    else:
+        success, message, code, can_download = handler(processor, params)
+    
+    if not success and can_download:
+        can_download = False
+        message = "此种功能无法给出表格"
+    return success, message, can_download
+
 @app.route('/process', methods=['POST'])
 def process_data():
     try:
@@ -1042,79 +1842,133 @@ def process_data():
         operation = data.get('operation')
         params = data.get('parameters', {})
         
-        success = False
-        message = ""
-        code = ""
-        can_download = True
-        
-        if operation == 'missing_values':
-            method = params.get('method', 'drop')
-            fill_value = params.get('fill_value')
-            success, message, code = processor.handle_missing_values(method, fill_value)
-        
-        elif operation == 'outliers':
-            method = params.get('method', 'iqr')
-            threshold = params.get('threshold', 3)
-            success, message, code = processor.handle_outliers(method, threshold)
-        
-        elif operation == 'duplicates':
-            success, message, code = processor.handle_duplicates()
-        
-        elif operation == 'standardization':
-            method = params.get('method', 'zscore')
-            success, message, code = processor.standardize_data(method)
-        
-        elif operation == 'correlation':
-            success, message, code, can_download = processor.correlation_analysis()
+        processor = get_processor()
+        if processor is None:
+            return jsonify({'success': False, 'message': '请先上传文件'})
         
-        elif operation == 't_test':
-            column1 = params.get('column1')
-            column2 = params.get('column2')
-            value = params.get('value')
-            success, message, code, can_download = processor.t_test(column1, column2, value)
+        with processor.lock, processing_slot():
+            history_length = len(processor.code_history)
+            previous_code_version = processor.code_version
+            
+            success, message, can_download = run_operation(processor, operation, params)
+            
+            # 只返回本次新增的代码，完整代码由 /code 按需获取
+            new_code = "\n".join(processor.code_history[history_length:])
+            code_version = processor.code_version
+            data_version = processor.version
         
-        elif operation == 'chi_square':
-            column1 = params.get('column1')
-            column2 = params.get('column2')
-            success, message, code, can_download = processor.chi_square_test(column1, column2)
+        return jsonify({
+            'success': success,
+            'message': message,
+            'code': new_code,
+            'previous_code_version': previous_code_version,
+            'code_version': code_version,
+            'data_version': data_version,
+            'can_download': can_download
+        })
+    
+    except ServiceUnavailable:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'处理失败: {str(e)}'})
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """一次请求按顺序执行多个操作，省去逐个往返；某一步失败时停止，之前的步骤保留"""
+    try:
+        operations = request.json.get('operations', [])
+        if len(operations) > MAX_BATCH_OPS:
+            return jsonify({'success': False, 'message': f'一次最多执行{MAX_BATCH_OPS}个操作'}), 400
         
-        if not success and can_download:
-            can_download = False
-            message = "此种功能无法给出表格"
+        processor = get_processor()
+        if processor is None:
+            return jsonify({'success': False, 'message': '请先上传文件'})
         
-        complete_code = processor.get_complete_code()
+        results = []
+        with processor.lock, processing_slot():
+            history_length = len(processor.code_history)
+            previous_code_version = processor.code_version
+            
+            for item in operations:
+                success, message, can_download = run_operation(
+                    processor, item.get('operation'), item.get('parameters', {}))
+                results.append({'success': success, 'message': message, 'can_download': can_download})
+                if not success:
+                    break
+            
+            new_code = "\n".join(processor.code_history[history_length:])
+            code_version = processor.code_version
+            data_version = processor.version
         
+        success = bool(results) and results[-1]['success']
+        if success:
+            message = "\n".join(result['message'] for result in results)
+        else:
+            message = results[-1]['message'] if results else "没有要执行的操作"
         return jsonify({
             'success': success,
             'message': message,
-            'code': complete_code,
-            'can_download': can_download
+            'results': results,
+            'code': new_code,
+            'previous_code_version': previous_code_version,
+            'code_version': code_version,
+            'data_version': data_version,
+            'can_download': success and results[-1]['can_download']
         })
     
+    except ServiceUnavailable:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'处理失败: {str(e)}'})
 
+@app.route('/code', methods=['GET'])
+def get_code():
+    processor = get_processor()
+    if processor is None:
+        return jsonify({'error': '没有可用的代码'}), 404
+    
+    with processor.lock:
+        code = processor.get_complete_code()
+        code_version = processor.code_version
+    
+    response = jsonify({'code': code, 'code_version': code_version})
+    # 代码未变化时返回304；no-cache让浏览器每次都带If-None-Match重新验证
+    response.set_etag(f"{g.job_id}-{code_version}")
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/download')
 def download_file():
     try:
-        excel_file = processor.to_excel()
-        return send_file(
+        processor = get_processor()
+        if processor is None:
+            return jsonify({'error': '下载失败: 请先上传文件'}), 404
+        
+        with processor.lock:
+            excel_file = processor.to_excel()
+            data_version = processor.version
+        # 数据未变化时浏览器凭ETag得到304，不再重复传输整个文件
+        response = send_file(
             excel_file,
             as_attachment=True,
             download_name='processed_data.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            etag=f"{g.job_id}-{data_version}",
+            conditional=True
         )
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': f'下载失败: {str(e)}'}), 500
 
 @app.route('/reset', methods=['POST'])
 def reset_processor():
-    global processor
-    processor = DataProcessor()
+    drop_processor()
     return jsonify({'success': True, 'message': '已重置，可以上传新文件'})
 
 # Vercel需要这个入口点
 app_instance = app
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # 多线程处理请求：一个会话的计算不会阻塞其他会话
+    app.run(debug=True, threaded=True)